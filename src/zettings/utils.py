@@ -1,56 +1,68 @@
 from __future__ import annotations
 
-import re
-from typing import Any
+import sys
+from functools import lru_cache
+from typing import TYPE_CHECKING, Any
 
+if TYPE_CHECKING:
+    from collections.abc import Iterator
 
 def validate_dictionary(d: dict) -> None:
-    has_dict_values = False
-    for v in d.values():
-        if isinstance(v, dict):
-            has_dict_values = True
-
-    if has_dict_values:
+    # Flat dictionaries (dotted keys only) skip the nested walk
+    if any(isinstance(v, dict) for v in d.values()):
         validate_dictionary_keys_loop(d)
     else:
+        # split_key validates every part and caches the split for the lookups that follow
         for k in d:
-            keys = k.split(".")
-            for sub_k in keys:
-                if not is_valid_key(sub_k):
-                    error_msg = (
-                        f"Invalid key: '{sub_k}'. "
-                        "Keys must be alphanumeric, underscores, or dashes, "
-                        "and cannot contain spaces or quotes."
-                    )
-                    raise ValueError(error_msg)
+            split_key(k)
 
 
-def validate_dictionary_keys_loop(d: dict) -> None:
-    """Validate that all keys in the dictionary are valid."""
-    for key, value in d.items():
-        if not is_valid_key(key):
-            error_msg = (
-                f"Invalid key: '{key}'. "
-                "Keys must be alphanumeric, underscores, or dashes, "
-                "and cannot contain spaces or quotes."
-            )
-            raise ValueError(error_msg)
-        if isinstance(value, dict):
-            validate_dictionary_keys_loop(value)
+def flatten_dictionary(d: dict, parent_key: str = "") -> Iterator[tuple[str, Any]]:
+    """Yield a (dotted key, value) pair for every leaf in a nested dictionary.
+
+    Empty dictionaries are yielded as leaves so they are not lost.
+    """
+    for k, v in d.items():
+        full_key = f"{parent_key}.{k}" if parent_key else k
+        if isinstance(v, dict) and v:
+            yield from flatten_dictionary(v, full_key)
+        else:
+            yield full_key, v
 
 
+def validate_dictionary_keys_loop(d: dict) -> None:
+    """Validate that all keys in the dictionary are valid."""
+    stack = [d]
+    while stack:
+        for key, value in stack.pop().items():
+            if not is_valid_key(key):
+                error_msg = (
+                    f"Invalid key: '{key}'. "
+                    "Keys must be alphanumeric, underscores, or dashes, "
+                    "and cannot contain spaces or quotes."
+                )
+                raise ValueError(error_msg)
+            if isinstance(value, dict):
+                stack.append(value)
+
+
+@lru_cache(maxsize=1024)
 def is_valid_key(key: str) -> bool:
     # Bare keys: a-z, A-Z, 0-9, _, -, no quotes or spaces
     # No support for keys with nested quotes
-    return bool(re.fullmatch(r"[A-Za-z0-9_-]+", key))
+    # isalnum() also accepts non-ASCII letters and digits, hence the isascii() check
+    return key.isascii() and key.replace("_", "a").replace("-", "a").isalnum()
 
 
-def set_nested_value(d: dict, key: str, value: Any, sep: str = ".") -> None:  # noqa: ANN401
-    """Set a nested value in a dictionary by key."""
-    keys = key.split(sep)
-    previous_key = None
-    previous_dict = {}
-    for k in keys[:-1]:
+@lru_cache(maxsize=4096)
+def split_key(key: str, sep: str = ".") -> tuple[str, ...]:
+    """Split a nested key into its parts and validate each one.
+
+    The result is cached since the same keys tend to be read and written over and over.
+    The parts are interned so dictionary lookups can match keys by identity.
+    """
+    keys = tuple(sys.intern(k) for k in key.split(sep))
+    for k in keys:
         if not is_valid_key(k):
             error_msg = (
                 f"Invalid key: '{k}'. "
@@ -58,66 +70,58 @@ def set_nested_value(d: dict, key: str, value: Any, sep: str = ".") -> None:  #
                 "and cannot contain spaces or quotes."
             )
             raise ValueError(error_msg)
+    return keys
 
-        if not isinstance(d, dict):
+
+def set_nested_value(d: dict, key: str, value: Any, sep: str = ".") -> None:  # noqa: ANN401
+    """Set a nested value in a dictionary by key."""
+    if sep not in key and is_valid_key(key):
+        d[key] = value
+        return
+
+    set_nested_path(d, split_key(key, sep), value)
+
+
+def set_nested_path(d: dict, keys: tuple[str, ...], value: Any) -> None:  # noqa: ANN401
+    """Set a nested value in a dictionary by a key that is already split and validated."""
+    for k in keys[:-1]:
+        child = d.get(k)
+        if child is None:
+            child = d[k] = {}
+        elif not isinstance(child, dict):
             error_msg = f"Cannot set nested value for key '{keys[-1]}': '{k}' is not a dictionary."
             raise KeyError(error_msg)
-        if k not in d:
-            d[k] = {}
-
-        previous_dict = d
-        previous_key = k
-        d = d[k]
-    if not is_valid_key(keys[-1]):
-        error_msg = (
-            f"Invalid key: '{keys[-1]}'. "
-            "Keys must be alphanumeric, underscores, or dashes, "
-            "and cannot contain spaces or quotes."
-        )
-        raise ValueError(error_msg)
-
-    if previous_key is not None and not isinstance(previous_dict[previous_key], dict):
-        error_msg = f"Cannot set nested value for key '{keys[-1]}': '{previous_key}' is not a dictionary."
-        raise KeyError(error_msg)
+        d = child
 
     d[keys[-1]] = value
 
 
 def get_nested_value(d: dict, key: str, sep: str = ".") -> Any | None:  # noqa: ANN401
     """Get a nested value from a dictionary by key."""
-    keys = key.split(sep)
-    for k in keys:
-        if not is_valid_key(k):
-            error_msg = (
-                f"Invalid key: '{k}'. "
-                "Keys must be alphanumeric, underscores, or dashes, "
-                "and cannot contain spaces or quotes."
-            )
-            raise ValueError(error_msg)
-        if isinstance(d, dict) and k in d:
-            d = d[k]
-        else:
+    if sep not in key and is_valid_key(key):
+        return d.get(key)
+
+    for k in split_key(key, sep):
+        if not isinstance(d, dict):
             return None
+        d = d.get(k)
     return d
 
 
 def delete_nested_key(d: dict, key: str, sep: str = ".") -> None:
     """Delete a nested key from a dictionary."""
-    keys = key.split(sep)
-    for k in keys:
-        if not is_valid_key(k):
-            error_msg = (
-                f"Invalid key: '{k}'. "
-                "Keys must be alphanumeric, underscores, or dashes, "
-                "and cannot contain spaces or quotes."
-            )
-            raise KeyError(error_msg)
-
+    if sep not in key and is_valid_key(key):
+        del d[key]
+        return
+
+    try:
+        keys = split_key(key, sep)
+    except ValueError as e:
+        raise KeyError(str(e)) from None
+    for k in keys[:-1]:
+        d = d[k]
         if not isinstance(d, dict):
             error_msg = f"Cannot delete nested key '{key}': '{k}' is not a dictionary."
             raise KeyError(error_msg)
-        if keys[-1] in d:
-            del d[keys[-1]]
-            return
 
-        d = d[k]
+    del d[keys[-1]]
@@ -1,25 +1,81 @@
 from __future__ import annotations
 
+import hashlib
+import os
 import re
-from collections.abc import MutableMapping
+import secrets
+import stat
+import time
+from collections.abc import Callable, ItemsView, Iterator, KeysView, MutableMapping, ValuesView
+from contextlib import contextmanager
+from copy import deepcopy
 from datetime import datetime, timezone
+from functools import cache
 from pathlib import Path
-from threading import Lock
+from threading import RLock
 from typing import Any
 
-import toml
-
-from zettings.utils import delete_nested_key, get_nested_value, set_nested_value, validate_dictionary
+from zettings.utils import (
+    delete_nested_key,
+    flatten_dictionary,
+    get_nested_value,
+    set_nested_path,
+    set_nested_value,
+    validate_dictionary,
+)
 
 # Constants for metadata
 NOTICE_KEY = "metadata.notice"
 NOTICE = "This file was created by zettings."
 CREATED_KEY = "metadata.created"
 UPDATED_KEY = "metadata.updated"
+# Pre-split forms of the metadata keys, used internally to skip splitting and validation
+NOTICE_PATH = ("metadata", "notice")
+CREATED_PATH = ("metadata", "created")
+UPDATED_PATH = ("metadata", "updated")
+
+# Home-relative filepaths must look like '.name/subname.toml'
+FILEPATH_PATTERN = re.compile(r"\.?[a-zA-Z0-9_-]+[\\/][a-zA-Z0-9_-]+\.toml", re.IGNORECASE)
+
+# Filesystem timestamps can be coarse (up to 2 seconds on FAT), so a file modified within this window of
+# the last load or save is checked by content instead of trusting an unchanged fingerprint
+RACY_WINDOW_NS = 2_000_000_000
+
+# Flags for creating a temporary settings file: it must be new, and is written as bytes on every platform
+TEMP_FILE_FLAGS = os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0) | getattr(os, "O_NOFOLLOW", 0)
+
+READ_ONLY_MESSAGE = "Settings are read-only and cannot be modified."
+
+
+@cache
+def _toml_loads() -> Callable[[str], dict]:
+    """Return the TOML parser, preferring the standard library tomllib (Python 3.11+), which is faster than toml.
+
+    The parser is imported on first use so importing zettings doesn't pay for it, and resolved only once
+    since a failed import of tomllib isn't cached by Python and would be retried on every reload.
+    """
+    try:
+        import tomllib  # noqa: PLC0415
+    except ModuleNotFoundError:  # Python < 3.11
+        import toml  # noqa: PLC0415
+
+        return toml.loads
+    return tomllib.loads
+
+
+def _parse_toml(text: str) -> dict:
+    """Parse TOML text."""
+    return _toml_loads()(text)
+
+
+def _digest(content: bytes) -> bytes:
+    """Return a short hash of the settings file contents."""
+    return hashlib.blake2b(content, digest_size=16).digest()
 
 
 class Settings(MutableMapping[str, Any]):
-    lock = Lock()
+    # Reentrant so read-modify-write operations can hold it around _load and _save
+    lock = RLock()
 
     def __init__(
         self,
@@ -51,68 +107,180 @@ class Settings(MutableMapping[str, Any]):
 
         """
         # Validate the arguments
-        if not isinstance(filepath, (str, Path)):
-            error_message = "filepath must be a string or Path"
-            raise TypeError(error_message)
         if isinstance(filepath, str):
-            if not re.fullmatch(r"^(?:\.)?[a-zA-Z0-9_-]+[\\/]{1}[a-zA-Z0-9_-]+\.toml$", filepath, re.IGNORECASE):
+            if not FILEPATH_PATTERN.fullmatch(filepath):
                 error_message = (
                     "home_filepath must be alphanumeric, underscores, or dashes in format '.name/subname.toml'"
                 )
                 raise ValueError(error_message)
             self._filepath = Path.home() / filepath
+        elif isinstance(filepath, Path):
+            self._filepath = filepath
         else:
-            self._filepath = filepath  # assume Path object
-        if not isinstance(defaults, (dict, type(None))):
+            error_message = "filepath must be a string or Path"
+            raise TypeError(error_message)
+        if defaults is not None and not isinstance(defaults, dict):
             error_message = "defaults must be a dictionary or None"
             raise TypeError(error_message)
-        if not isinstance(always_reload, bool):
+        if type(always_reload) is not bool:
             error_message = "always_reload must be a boolean"
             raise TypeError(error_message)
-        if not isinstance(read_only, bool):
+        if type(read_only) is not bool:
             error_message = "read_only must be a boolean"
             raise TypeError(error_message)
 
         self.always_reload = always_reload
         self.read_only = read_only
         self._data = {}
+        self._fingerprint: tuple[int, int, int] | None = None
+        self._digest = b""
+        self._remembered_at_ns = 0
+        self._batch_depth = 0
+        self._batch_dirty = False
         if defaults is None:
             defaults = {}
 
         validate_dictionary(defaults)
         if not self.read_only:
-            self._initialize_file()
-            self._initialize_defaults(defaults)
+            now = datetime.now(tz=timezone.utc).isoformat()
+            with self.lock:
+                is_new_file = self._initialize_file(now)
+                # Write the file once, and only if it is new or a default was missing
+                if self._initialize_defaults(defaults) or is_new_file:
+                    self._save(now)
+
+    def _initialize_file(self, now: str) -> bool:
+        """Load the settings file, or set the metadata values for a new one.
 
-    def _initialize_file(self) -> None:
-        """Initialize the settings file with metadata values and sets defaults for missing keys."""
+        Args:
+        now (str): The ISO timestamp to use as the created time of a new file.
+
+        Returns:
+        bool: True if the settings file does not exist yet and still needs to be saved.
+
+        """
         if self._filepath.exists():
-            return
+            self._load()
+            return False
         self._filepath.parent.mkdir(parents=True, exist_ok=True)
-        set_nested_value(self._data, NOTICE_KEY, NOTICE)
-        set_nested_value(self._data, CREATED_KEY, datetime.now(tz=timezone.utc).isoformat())
-        set_nested_value(self._data, UPDATED_KEY, datetime.now(tz=timezone.utc).isoformat())
-        self._save()
-
-    def _initialize_defaults(self, d: dict, parent_key: str = "") -> None:
-        """Recursively set default values for missing keys in the settings dictionary."""
-        for k, v in d.items():
-            full_key = f"{parent_key}.{k}" if parent_key else k
-            if self.get(full_key) is None:
-                self.set(full_key, v)
-            elif isinstance(v, dict):
-                self._initialize_defaults(v, full_key)
-
-    def _save(self) -> None:
-        """Save the settings to the file and update the updated timestamp."""
-        set_nested_value(self._data, UPDATED_KEY, datetime.now(tz=timezone.utc).isoformat())
-        with self.lock, Path.open(self._filepath, mode="w", encoding="utf-8") as f:
-            toml.dump(self._data, f)
+        set_nested_path(self._data, NOTICE_PATH, NOTICE)
+        set_nested_path(self._data, CREATED_PATH, now)
+        return True
+
+    def _initialize_defaults(self, d: dict) -> bool:
+        """Set default values for missing keys in memory. Return True if anything was set."""
+        changed = False
+        for key, value in flatten_dictionary(d):
+            if get_nested_value(self._data, key) is None:
+                set_nested_value(self._data, key, deepcopy(value))
+                changed = True
+        return changed
+
+    def _save(self, now: str | None = None) -> None:
+        """Save the settings to the file and update the updated timestamp.
+
+        A timestamp taken earlier in the same operation can be passed as now to avoid reading the clock again.
+
+        The settings are written to a temporary file that then replaces the settings file,
+        so readers never see a partially written file.
+        """
+        if self._batch_depth:
+            self._batch_dirty = True
+            return
+
+        if now is None:
+            now = datetime.now(tz=timezone.utc).isoformat()
+        set_nested_path(self._data, UPDATED_PATH, now)
+        # Imported here so importing zettings, and read-only use, don't pay for loading toml
+        import toml  # noqa: PLC0415
+
+        content = toml.dumps(self._data).encode("utf-8")
+        with self.lock:
+            self._replace_file(content)
+            # Keep what was actually written, since toml.dumps can change values (tuples become lists, for one)
+            self._data = _parse_toml(content.decode("utf-8"))
+            self._remember_file(self._file_fingerprint(), _digest(content))
+
+    def _replace_file(self, content: bytes) -> None:
+        """Replace the settings file with content through a uniquely named temporary file in the same directory.
+
+        Each write gets its own temporary file, so concurrent writers never share one. A new settings file gets
+        the usual permissions for a new file, an existing one keeps its permissions, and a symlinked settings
+        file is updated at its target instead of being replaced.
+        """
+        target = self._filepath.resolve()
+        temp_filepath = target.with_name(f".{target.name}.{secrets.token_hex(8)}.tmp")
+        # Mode 0o666 is filtered by the umask, just like creating the settings file directly
+        fd = os.open(temp_filepath, TEMP_FILE_FLAGS, 0o666)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+            if target.exists():
+                temp_filepath.chmod(stat.S_IMODE(target.stat().st_mode))
+            temp_filepath.replace(target)
+        except BaseException:
+            temp_filepath.unlink(missing_ok=True)
+            raise
 
     def _load(self) -> None:
-        """Load the settings from the file."""
-        with self.lock, Path.open(self._filepath, mode="r", encoding="utf-8") as f:
-            self._data = toml.load(f)
+        """Load the settings from the file, unless it is unchanged since the last load or save."""
+        if self._batch_dirty:
+            # Don't discard changes that are waiting to be saved at the end of a batch
+            return
+
+        with self.lock:
+            fingerprint = self._file_fingerprint()
+            if fingerprint == self._fingerprint and fingerprint[1] < self._remembered_at_ns - RACY_WINDOW_NS:
+                return
+            # The file may have changed, or changed too recently for its timestamp to tell.
+            # Compare the contents before paying for a parse.
+            content = self._filepath.read_bytes()
+            digest = _digest(content)
+            if digest != self._digest:
+                self._data = _parse_toml(content.decode("utf-8"))
+            self._remember_file(fingerprint, digest)
+
+    def _file_fingerprint(self) -> tuple[int, int, int]:
+        """Return the inode, modification time and size of the settings file, used to detect changes.
+
+        Every save replaces the file, so the inode changes even when two saves land within the same mtime tick.
+        """
+        stat = self._filepath.stat()
+        return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+    def _remember_file(self, fingerprint: tuple[int, int, int], digest: bytes) -> None:
+        """Record the fingerprint and content digest of the file that self._data now matches."""
+        self._fingerprint = fingerprint
+        self._digest = digest
+        self._remembered_at_ns = time.time_ns()
+
+    @contextmanager
+    def batch(self) -> Iterator[None]:
+        """Defer saving the settings file until the end of the block.
+
+        Every set or delete inside the block is applied in memory and the file is written once on exit.
+        Batches can be nested; the file is written when the outermost batch exits.
+
+        The settings lock is held for the whole block, so Settings in other threads wait to write or reload
+        until it exits instead of having their changes overwritten by the final save.
+
+        Example:
+            with settings.batch():
+                settings["a"] = 1
+                settings["b"] = 2
+
+        """
+        with self.lock:
+            if self._batch_depth == 0 and self.always_reload:
+                self._load()
+            self._batch_depth += 1
+            try:
+                yield
+            finally:
+                self._batch_depth -= 1
+                if self._batch_depth == 0 and self._batch_dirty:
+                    self._batch_dirty = False
+                    self._save()
 
     def get(self, key: str) -> Any | None:  # noqa: ANN401
         """Return a value from the configuration by key.
@@ -126,6 +294,9 @@ class Settings(MutableMapping[str, Any]):
         """
         if self.always_reload:
             self._load()
+            value = get_nested_value(self._data, key)
+            # Return a copy so changes to it don't linger in the cached settings and get saved by a later set()
+            return deepcopy(value) if isinstance(value, (dict, list)) else value
         return get_nested_value(self._data, key)
 
     def set(self, key: str, value: Any) -> None:  # noqa: ANN401
@@ -140,19 +311,46 @@ class Settings(MutableMapping[str, Any]):
 
         """
         if self.read_only:
-            error_message = "Settings are read-only and cannot be modified."
-            raise PermissionError(error_message)
-
-        if self.always_reload:
-            self._load()
-
-        set_nested_value(self._data, key, value)
-        self._save()
+            raise PermissionError(READ_ONLY_MESSAGE)
+
+        # _save replaces the cached settings with what it wrote, but a batch defers that, so until then
+        # store a copy so later changes to the caller's dict or list don't leak into the cached settings
+        if self._batch_depth and isinstance(value, (dict, list)):
+            value = deepcopy(value)
+
+        # Hold the lock across the whole read-modify-write so concurrent writers can't interleave
+        with self.lock:
+            if self.always_reload:
+                self._load()
+            if self._is_current_value(key, value):
+                return
+            set_nested_value(self._data, key, value)
+            self._save()
+
+    def _is_current_value(self, key: str, value: Any) -> bool:  # noqa: ANN401
+        """Return True if the key already holds this exact scalar value, so setting it would change nothing.
+
+        Types must match too, since 1 == 1.0 == True. Dicts and lists are never treated as current
+        because their items could compare equal across types.
+        """
+        if isinstance(value, (dict, list)):
+            return False
+        current = get_nested_value(self._data, key)
+        return current is not None and type(current) is type(value) and current == value
 
     def __getitem__(self, key: str) -> Any | None:  # noqa: ANN401
         """Get an item from the configuration by key."""
         return self.get(key)
 
+    def __contains__(self, key: object) -> bool:
+        """Return True if the key exists in the settings."""
+        if not isinstance(key, str):
+            return False
+        try:
+            return self.get(key) is not None
+        except ValueError:
+            return False
+
     def __setitem__(self, key: str, value: Any) -> None:  # noqa: ANN401
         """Set an item in the configuration by key."""
         self.set(key, value)
@@ -174,14 +372,13 @@ class Settings(MutableMapping[str, Any]):
 
         """
         if self.read_only:
-            error_message = "Settings are read only and cannot be modified."
-            raise PermissionError(error_message)
-
-        if self.always_reload:
-            self._load()
+            raise PermissionError(READ_ONLY_MESSAGE)
 
-        delete_nested_key(self._data, key)
-        self._save()
+        with self.lock:
+            if self.always_reload:
+                self._load()
+            delete_nested_key(self._data, key)
+            self._save()
 
     def __iter__(self):
         """Return an iterator over the keys in the settings."""
@@ -189,6 +386,25 @@ class Settings(MutableMapping[str, Any]):
             self._load()
         return iter(self._data)
 
+    def _snapshot(self) -> dict:
+        """Return a copy of the top-level settings, reloaded and deep-copied like get() if always_reload is set."""
+        if self.always_reload:
+            self._load()
+            return deepcopy(self._data)
+        return self._data.copy()
+
+    def keys(self) -> KeysView[str]:
+        """Return a snapshot of the top-level keys."""
+        return self._snapshot().keys()
+
+    def items(self) -> ItemsView[str, Any]:
+        """Return a snapshot of the top-level items."""
+        return self._snapshot().items()
+
+    def values(self) -> ValuesView[Any]:
+        """Return a snapshot of the top-level values."""
+        return self._snapshot().values()
+
     def __len__(self) -> int:
         """Return the number of items in the settings."""
         if self.always_reload:
@@ -199,8 +415,9 @@ class Settings(MutableMapping[str, Any]):
     def count(self, d: dict) -> int:
         """Count the number of items in a nested dictionary."""
         total = 0
-        for value in d.values():
-            total += 1
-            if isinstance(value, dict):
-                total += self.count(value)
+        stack = [d]
+        while stack:
+            current = stack.pop()
+            total += len(current)
+            stack.extend(value for value in current.values() if isinstance(value, dict))
         return total
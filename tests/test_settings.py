@@ -1,8 +1,14 @@
+import os
 import shutil
+import subprocess
+import sys
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 import pytest
 
+import zettings
 from zettings import Settings
 
 default_settings_normal_format = {
@@ -21,6 +27,13 @@ default_settings_nested_format = {
     "dictionary.subdictionary.key1": "subvalue1",
     "dictionary.subdictionary.key2": "subvalue2",
 }
+# Defaults with one key added, for tests that reopen a settings file with extended defaults
+default_settings_normal_format_with_foo = {**default_settings_normal_format, "foo": "bar"}
+default_settings_nested_format_with_key3 = {
+    **default_settings_nested_format,
+    "dictionary.subdictionary.key3": "subvalue3",
+}
+default_settings_nested_format_with_face = {**default_settings_nested_format, "settings.face": "round"}
 default_settings_invalid_normal_format = {
     "settings": {"name": "MyName", "mood": "MyMood"},
     "dictionary": {
@@ -37,20 +50,80 @@ default_settings_invalid_nested_format = {
     "dictionary.subdict'invalidionary.key1": "subvalue1",
     "dictionary.subdictionary.key2": "subvalue2",
 }
+default_settings_overlapping_keys = {
+    "key1.subkey": "value1",
+    "key1.subkey.subsubkey": "value2",
+}
+
+# Values of the wrong type for every Settings argument; each type test adds the cases specific to its argument
+invalid_type_values = [523, 4.2, ["settings.toml"]]
+
+
+def type_name(value):
+    # Short parametrize id for the wrong-type cases
+    return type(value).__name__
+
+
+# Every non-bool value for every bool flag of Settings
+bool_flag_type_cases = [
+    pytest.param(name, value, id=f"{name}-{type_name(value)}")
+    for name in ("always_reload", "read_only")
+    for value in [*invalid_type_values, "abc", None, {"settings.toml": "value"}]
+]
+
+# Settings file used by tests of the home-relative filepath form
+home_settings_name = ".test-blah-blah-test-only/settings.toml"
+home_settings_path = Path.home() / home_settings_name
+
+# Characters that are not allowed in either part of a home-relative filepath
+invalid_filepath_chars = " .:;'\"+@"
 
 
 @pytest.fixture
-def settings_filepath(tmpdir_factory: pytest.TempdirFactory):
-    temp_dir = str(tmpdir_factory.mktemp("temp"))
-    temp_testing_dir = temp_dir + "/testing/settings.toml"
-    yield Path(temp_testing_dir)
-    shutil.rmtree(temp_dir)
+def settings_filepath(tmp_path_factory: pytest.TempPathFactory):
+    # Every test reuses the same scratch directory, and its 'testing' subdirectory is removed afterwards
+    temp_dir = tmp_path_factory.getbasetemp() / "testing"
+    yield temp_dir / "settings.toml"
+    if temp_dir.exists():
+        shutil.rmtree(temp_dir)
+
+
+@pytest.fixture(scope="session")
+def canonical_settings_filepath(tmp_path_factory: pytest.TempPathFactory):
+    # Built once per session so tests that only need the normal defaults can start from a copy
+    filepath = tmp_path_factory.mktemp("canonical") / "settings.toml"
+    Settings(filepath=filepath, defaults=default_settings_normal_format)
+    return filepath
+
+
+@pytest.fixture
+def seeded_settings_filepath(canonical_settings_filepath, settings_filepath):
+    settings_filepath.parent.mkdir(parents=True)
+    shutil.copyfile(canonical_settings_filepath, settings_filepath)
+    return settings_filepath
+
+
+@pytest.fixture(scope="module")
+def shared_settings_filepath(tmp_path_factory: pytest.TempPathFactory):
+    return tmp_path_factory.mktemp("shared") / "settings.toml"
+
+
+@pytest.fixture(scope="module")
+def untouched_settings_filepath(tmp_path_factory: pytest.TempPathFactory):
+    # For tests that fail argument validation before the settings file is ever touched
+    return tmp_path_factory.mktemp("untouched") / "settings.toml"
+
+
+@pytest.fixture(scope="module")
+def shared_settings(shared_settings_filepath):
+    # One instance shared by tests that only read from it; tests that change settings build their own
+    return Settings(filepath=shared_settings_filepath, defaults=default_settings_normal_format)
 
 
 @pytest.fixture
 def temp_home():
-    name = ".test-blah-blah-test-only/settings.toml"
-    path = Path.home() / name
+    name = home_settings_name
+    path = home_settings_path
     temp_dir = path.parent
     if path.exists():
         path.unlink()
@@ -80,29 +153,20 @@ def test_settings_initializes_with_empty_file(settings_filepath):
     assert settings.get("metadata.created") is not None
     assert settings.get("metadata.updated") is not None
     assert settings.get("metadata.NotReal") is None
+    assert settings.get("metadata.created") == settings.get("metadata.updated")
 
 
-def test_settings_initializes_with_default_settings_normal_format(settings_filepath):
-    settings = Settings(settings_filepath, defaults=default_settings_normal_format)
-    for k, v in default_settings_normal_format.items():
-        assert settings.get(k) == v
-
-    assert settings.get("settings.name") == "MyName"
-    assert settings.get("settings.mood") == "MyMood"
-    assert settings.get("dictionary.key1") == "value1"
-    assert settings.get("dictionary") == {
-        "key1": "value1",
-        "key2": "value2",
-        "subdictionary": {"key1": "subvalue1", "key2": "subvalue2"},
-    }
-
-    assert settings.get("foo") is None
-
-
-def test_settings_initializes_with_default_settings_nested_format(settings_filepath):
-    settings = Settings(settings_filepath, defaults=default_settings_nested_format)
-    for k, v in default_settings_nested_format.items():
-        assert settings.get(k) == v
+@pytest.mark.parametrize(
+    ("defaults"),
+    [
+        (default_settings_normal_format),
+        (default_settings_nested_format),
+    ],
+    ids=["normal-format", "nested-format"],
+)
+def test_settings_initializes_with_default_settings(settings_filepath, defaults):
+    settings = Settings(settings_filepath, defaults=defaults)
+    assert {k: settings.get(k) for k in defaults} == defaults
 
     assert settings.get("settings.name") == "MyName"
     assert settings.get("settings.mood") == "MyMood"
@@ -117,20 +181,6 @@ def test_settings_initializes_with_default_settings_nested_format(settings_filep
 
 
 ## Type Tests
-@pytest.mark.parametrize(
-    ("value"),
-    [
-        (523),
-        (None),
-        (["settings.toml"]),
-        ({"settings.toml": "value"}),
-    ],
-)
-def test_settings_name_type_fails(value):
-    with pytest.raises(TypeError):
-        _ = Settings(value, read_only=True)
-
-
 @pytest.mark.parametrize(
     ("value"),
     [
@@ -143,6 +193,8 @@ def test_settings_name_type_fails(value):
         "/settings.toml",
         "test/.toml",
         ".test/settings.json",
+        *[f"abc{c}def/settings.toml" for c in invalid_filepath_chars],
+        *[f"abc/set{c}tings.toml" for c in invalid_filepath_chars],
     ],
 )
 def test_settings_name_alphanumericish_fails(value):
@@ -166,72 +218,39 @@ def test_settings_name_alphanumericish_passes(value):
     _ = Settings(value, read_only=True)
 
 
-@pytest.mark.parametrize(
-    ("value"),
-    [
-        (523),
-        ("abc"),
-    ],
-)
-def test_settings_defaults_type_fails(settings_filepath, value):
-    with pytest.raises(TypeError):
-        _ = Settings(filepath=settings_filepath, defaults=value)
-
-
-@pytest.mark.parametrize(
-    ("value"),
-    [
-        (523),
-        ("abc"),
-        (["settings.toml"]),
-        ({"settings.toml": "value"}),
-    ],
-)
-def test_settings_always_reloads_type_fails(settings_filepath, value):
+@pytest.mark.parametrize("value", [*invalid_type_values, "abc"], ids=type_name)
+def test_settings_defaults_type_fails(untouched_settings_filepath, value):
     with pytest.raises(TypeError):
-        _ = Settings(filepath=settings_filepath, defaults=value, always_reload=value)
+        _ = Settings(filepath=untouched_settings_filepath, defaults=value)
 
 
-@pytest.mark.parametrize(
-    ("value"),
-    [
-        (523),
-        ("abc"),
-        (["settings.toml"]),
-        ({"settings.toml": "value"}),
-    ],
-)
-def test_settings_read_only_type_fails(settings_filepath, value):
+@pytest.mark.parametrize(("name", "value"), bool_flag_type_cases)
+def test_settings_bool_flag_type_fails(untouched_settings_filepath, name, value):
     with pytest.raises(TypeError):
-        _ = Settings(filepath=settings_filepath, defaults=value, read_only=value)
+        _ = Settings(filepath=untouched_settings_filepath, **{name: value})
 
 
-@pytest.mark.parametrize(
-    ("value"),
-    [
-        (523),
-        (False),
-        (["settings.toml"]),
-        ({"settings.toml": "value"}),
-    ],
-)
+@pytest.mark.parametrize("value", [*invalid_type_values, None, False, {"settings.toml": "value"}], ids=type_name)
 def test_settings_filepath_type_fails(value):
     with pytest.raises(TypeError):
         _ = Settings(filepath=value)
 
 
+def test_settings_default_flags(shared_settings):
+    assert shared_settings.always_reload is True
+    assert shared_settings.read_only is False
+
+
 ## End Type Tests
 def test_settings_sets_missing_keys_in_defaults(settings_filepath):
-    defaults = default_settings_normal_format.copy()
-    settings = Settings(filepath=settings_filepath, defaults=defaults)
+    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
     assert settings.get("foo") is None
 
-    defaults["foo"] = "bar"
+    defaults = default_settings_normal_format_with_foo
     new_settings = Settings(filepath=settings_filepath, defaults=defaults)
 
     assert new_settings.get("foo") == "bar"
-    for k, v in defaults.items():
-        assert new_settings.get(k) == v
+    assert {k: new_settings.get(k) for k in defaults} == defaults
 
 
 def test_settings_get_and_set_methods_success(settings_filepath):
@@ -270,8 +289,8 @@ def test_settings_get_and_set_methods_success(settings_filepath):
     assert settings.get("emoji") == "😊"
 
 
-def test_settings_overrides_existing_settings(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_overrides_existing_settings(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
 
     # Set an initial value
     settings.set("name", "InitialName")
@@ -282,30 +301,24 @@ def test_settings_overrides_existing_settings(settings_filepath):
     assert settings.get("name") == "NewName"
 
 
-def test_settings_handles_non_existent_keys(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
-
-    assert settings.get("non_existent_key") is None
+def test_settings_handles_non_existent_keys(shared_settings):
+    assert shared_settings.get("non_existent_key") is None
 
 
 def test_settings_handles_empty_settings_file(settings_filepath):
     # Create an empty settings file
     settings_filepath.parent.mkdir(parents=True, exist_ok=True)
-    with Path.open(settings_filepath, "w") as f:
-        f.write("")
+    settings_filepath.write_text("")
     settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
     # Check that default settings are applied
-    for k, v in default_settings_normal_format.items():
-        assert settings.get(k) == v
+    assert {k: settings.get(k) for k in default_settings_normal_format} == default_settings_normal_format
 
 
 def test_settings_handles_creating_directories_for_new_files(settings_filepath):
-    parent_dir = settings_filepath.parent
-
-    assert not parent_dir.exists(), "Parent directory should not exist before test"
+    assert not settings_filepath.parent.exists(), "Parent directory should not exist before test"
 
     _ = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
-    assert parent_dir.exists(), "Parent directory should be created by Settings class"
+    assert settings_filepath.parent.is_dir(), "Parent directory should be created by Settings class"
 
 
 def test_settings_saves_settings_to_file(settings_filepath):
@@ -321,8 +334,8 @@ def test_settings_saves_settings_to_file(settings_filepath):
     assert new_settings.get("mood") == "TestMood"
 
 
-def test_settings_with_different_cases_in_key(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_with_different_cases_in_key(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings["caseCheck"] = "value"
 
     assert settings["caseCheck"] == "value"
@@ -346,8 +359,8 @@ def test_settings_no_default_settings(settings_filepath):
     assert new_settings.get("name") == "NoDefaultName"
 
 
-def test_settings_with_getitem_and_setitem(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_with_getitem_and_setitem(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
 
     # Test __getitem__
     assert settings["settings.name"] == "MyName"
@@ -363,15 +376,12 @@ def test_settings_with_getitem_and_setitem(settings_filepath):
 
 
 def test_settings_updates_defaults_with_nested_dict(settings_filepath: Path):
-    defaults = default_settings_nested_format.copy()
-    settings = Settings(filepath=settings_filepath, defaults=defaults)
+    settings = Settings(filepath=settings_filepath, defaults=default_settings_nested_format)
     assert settings.get("dictionary.subdictionary.key3") is None
     assert settings["dictionary.subdictionary.key3"] is None
 
-    defaults["dictionary.subdictionary.key3"] = "subvalue3"
-
     # Access a nested value
-    new_settings = Settings(filepath=settings_filepath, defaults=defaults)
+    new_settings = Settings(filepath=settings_filepath, defaults=default_settings_nested_format_with_key3)
     assert new_settings.get("dictionary.subdictionary.key3") == "subvalue3"
     assert new_settings["dictionary"]["subdictionary"]["key3"] == "subvalue3"
 
@@ -393,46 +403,43 @@ def test_settings_sets_default_settings_of_nested_dictionaries_if_not_present(se
     assert settings.get("settings.mood") == "MyMood"
     assert settings.get("settings.face") is None
 
-    new_default_settings = default_settings_nested_format.copy()
-    new_default_settings["settings.face"] = "round"
-
-    new_settings = Settings(filepath=settings_filepath, defaults=new_default_settings)
+    new_settings = Settings(filepath=settings_filepath, defaults=default_settings_nested_format_with_face)
 
     assert settings.get("settings.face") == "round"
     assert new_settings.get("settings.face") == "round"
 
 
-def test_settings_always_reload_true(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_always_reload_true(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
 
     assert settings.get("settings.name") == "MyName"
 
     # Change the settings file seperatrely
-    settings2 = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    settings2 = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings2.set("settings.name", "NewName")
 
     # Verify that the change is reflected in the original settings object
     assert settings.get("settings.name") == "NewName"
 
 
-def test_settings_always_reload_false(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_always_reload_false(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings.always_reload = False
 
     assert settings.get("settings.name") == "MyName"
 
     # Change the settings file seperatrely
-    settings2 = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    settings2 = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings2.set("settings.name", "NewName")
 
 
-def test_settings_dynamic_reload_true_set(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_dynamic_reload_true_set(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
 
     assert settings.get("settings.name") == "MyName"
 
     # Change the settings file seperatrely
-    settings2 = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    settings2 = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings2.set("settings.name", "NewName3")
 
     # Verify that the change is reflected in the original settings object
@@ -440,14 +447,14 @@ def test_settings_dynamic_reload_true_set(settings_filepath):
     assert settings.get("settings.name") == "NewName3"
 
 
-def test_settings_dynamic_reload_false_set(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_dynamic_reload_false_set(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings.always_reload = False
 
     assert settings.get("settings.name") == "MyName"
 
     # Change the settings file seperatrely
-    settings2 = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    settings2 = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
     settings2.set("settings.name", "NewName3")
 
     # Verify that the change is reflected in the original settings object
@@ -458,9 +465,9 @@ def test_settings_dynamic_reload_false_set(settings_filepath):
     assert settings.get("settings.name") == "NewName4"
 
 
-def test_settings_read_only_true(settings_filepath):
+def test_settings_read_only_true(seeded_settings_filepath):
     settings = Settings(
-        filepath=settings_filepath,
+        filepath=seeded_settings_filepath,
         defaults=default_settings_normal_format,
         read_only=True,
     )
@@ -471,13 +478,15 @@ def test_settings_read_only_true(settings_filepath):
 
 
 # Verify that the change is reflected in the original settings object
-def test_settings_repr_returns_expected_string(settings_filepath):
-    settings = Settings(
-        filepath=settings_filepath,
-        defaults=default_settings_normal_format,
-    )
-    expected = f"Settings stored at: {settings_filepath}"
-    assert repr(settings) == expected
+@pytest.mark.parametrize("key", ["invalid key", "settings.invalid key", "quoted'key", "settings..name", ""])
+def test_settings_get_invalid_key_fails(shared_settings, key):
+    with pytest.raises(ValueError, match="Invalid key"):
+        shared_settings.get(key)
+
+
+def test_settings_repr_returns_expected_string(shared_settings, shared_settings_filepath):
+    expected = f"Settings stored at: {shared_settings_filepath}"
+    assert repr(shared_settings) == expected
 
 
 def test_settings_stores_in_home_directory_if_no_filepath(temp_home):
@@ -485,15 +494,18 @@ def test_settings_stores_in_home_directory_if_no_filepath(temp_home):
     assert temp_home["path"].exists() is True
 
 
-def test_settings_fails_with_invalid_defaults_format(settings_filepath):
-    with pytest.raises(ValueError):
-        Settings(filepath=settings_filepath, defaults=default_settings_invalid_normal_format)
-
-    # Verify that the settings file is not created
-    assert not settings_filepath.exists()
-
-    with pytest.raises(ValueError):
-        Settings(filepath=settings_filepath, defaults=default_settings_invalid_nested_format)
+@pytest.mark.parametrize(
+    ("defaults", "error"),
+    [
+        (default_settings_invalid_normal_format, ValueError),
+        (default_settings_invalid_nested_format, ValueError),
+        (default_settings_overlapping_keys, KeyError),
+    ],
+    ids=["quoted-key-normal", "quoted-key-nested", "overlapping-keys"],
+)
+def test_settings_fails_with_invalid_defaults_format(settings_filepath, defaults, error):
+    with pytest.raises(error):
+        Settings(filepath=settings_filepath, defaults=defaults)
 
     # Verify that the settings file is not created
     assert not settings_filepath.exists()
@@ -506,14 +518,10 @@ def test_settings_iter_and_len_method_with_reload_true(settings_filepath):
     settings2.set("newkey", "newkeyvalue")
 
     # Test the iter method
-    keys = list(settings)
-    assert "settings" in keys
-    assert "metadata" in keys
-    assert "dictionary" in keys
-    assert "newkey" in keys
-
-    assert len(keys) == 4
-    assert len(settings) == 12
+    assert set(settings) == {"settings", "metadata", "dictionary", "newkey"}
+    assert len(settings) == 14
+    assert settings.get("metadata.notice") is not None
+    assert settings.get("metadata.created") is not None
 
 
 def test_settings_iter_and_len_method_with_reload_false(settings_filepath):
@@ -522,13 +530,7 @@ def test_settings_iter_and_len_method_with_reload_false(settings_filepath):
 
     settings2.set("newkey", "newkeyvalue")
 
-    keys = list(settings)
-    assert "settings" in keys
-    assert "metadata" in keys
-    assert "dictionary" in keys
-    assert "newkey" not in keys
-
-    assert len(keys) == 3
+    assert set(settings) == {"settings", "metadata", "dictionary"}
 
 
 def test_settings_del_method(settings_filepath):
@@ -561,8 +563,8 @@ def test_settings_del_method(settings_filepath):
     assert settings.get("nested.another_key") is None
 
 
-def test_settings_delete_with_read_only_true(settings_filepath):
-    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+def test_settings_delete_with_read_only_true(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
 
     settings.read_only = True
     with pytest.raises(PermissionError):
@@ -584,34 +586,298 @@ def test_get_with_duplicate_keynames(settings_filepath):
     }
 
     settings = Settings(filepath=settings_filepath, defaults=defaults)
+    assert {k: settings.get(k) for k in defaults} == defaults
 
-    assert settings.get("key1.test") == "value1"
-    assert settings.get("key1.subkey.subsubkey") == "value2"
-    assert settings.get("key2.test") == "value3"
-    assert settings.get("key2.subkey.subsubkey") == "value4"
-    assert settings.get("key3.test") == "value5"
-    assert settings.get("key3.subkey.subsubkey") == "value6"
-
-    settings.set("key1.test", "new_value1")
-    settings.set("key1.subkey.subsubkey", "new_value2")
-    settings.set("key2.test", "new_value3")
-    settings.set("key2.subkey.subsubkey", "new_value4")
-    settings.set("key3.test", "new_value5")
-    settings.set("key3.subkey.subsubkey", "new_value6")
-
-    assert settings.get("key1.test") == "new_value1"
-    assert settings.get("key1.subkey.subsubkey") == "new_value2"
-    assert settings.get("key2.test") == "new_value3"
-    assert settings.get("key2.subkey.subsubkey") == "new_value4"
-    assert settings.get("key3.test") == "new_value5"
-    assert settings.get("key3.subkey.subsubkey") == "new_value6"
-
-
-def test_another_invalid_defaults_format(settings_filepath):
-    defaults = {
-        "key1.subkey": "value1",
-        "key1.subkey.subsubkey": "value2",
-    }
+    new_values = {k: v.replace("value", "new_value") for k, v in defaults.items()}
+    for k, v in new_values.items():
+        settings.set(k, v)
+    assert {k: settings.get(k) for k in new_values} == new_values
+
+
+def test_settings_set_copies_mutable_values(settings_filepath):
+    settings = Settings(filepath=settings_filepath)
+
+    value = {"key": "value", "list": [1, 2]}
+    settings.set("dict", value)
+    value["key"] = "changed"
+    value["list"].append(3)
+
+    assert settings.get("dict.key") == "value"
+    assert settings.get("dict.list") == [1, 2]
+
+    with settings.batch():
+        settings.set("batched", value)
+        value["key"] = "changed again"
+    assert settings.get("batched.key") == "changed"
+
+
+def test_settings_save_replaces_file_without_leftovers(settings_filepath):
+    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    settings.set("settings.name", "NewName")
+
+    assert [p.name for p in settings_filepath.parent.iterdir()] == [settings_filepath.name]
+    assert Settings(filepath=settings_filepath).get("settings.name") == "NewName"
+
+
+def test_settings_batch_saves_once_on_exit(settings_filepath):
+    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    other = Settings(filepath=settings_filepath)
+
+    with settings.batch():
+        settings.set("settings.name", "BatchName")
+        with settings.batch():
+            settings["settings.mood"] = "BatchMood"
+        del settings["dictionary.key1"]
+
+        # Nothing is written until the outermost batch exits
+        assert other.get("settings.name") == "MyName"
+        assert settings.get("settings.name") == "BatchName"
+
+    assert other.get("settings.name") == "BatchName"
+    assert other.get("settings.mood") == "BatchMood"
+    assert other.get("dictionary.key1") is None
+
+
+def test_settings_batch_does_not_overwrite_other_writers(settings_filepath):
+    settings = Settings(filepath=settings_filepath)
+    other = Settings(filepath=settings_filepath)
+    writer = threading.Thread(target=other.set, args=("y", 2))
+
+    with settings.batch():
+        settings["x"] = 1
+        # The other writer waits for the batch instead of saving in the middle of it
+        writer.start()
+        writer.join(timeout=0.2)
+        assert writer.is_alive()
+    writer.join()
+
+    reloaded = Settings(filepath=settings_filepath)
+    assert reloaded.get("x") == 1
+    assert reloaded.get("y") == 2
+
+
+def test_settings_get_reflects_changes_after_cached_lookup(settings_filepath):
+    settings = Settings(filepath=settings_filepath, always_reload=False)
+
+    settings.set("a", {"b": 1})
+    assert settings.get("a.b") == 1
+    settings.set("a.b", 2)
+    assert settings.get("a.b") == 2
+    settings.set("a", {"b": 3})
+    assert settings.get("a.b") == 3
+    del settings["a"]
+    assert settings.get("a.b") is None
+
+
+def test_settings_contains(shared_settings):
+    assert "settings" in shared_settings
+    assert "settings.name" in shared_settings
+    assert "dictionary.subdictionary.key1" in shared_settings
+    assert "foo" not in shared_settings
+    assert "settings.foo" not in shared_settings
+    assert "settings.name.foo" not in shared_settings
+    assert "invalid key" not in shared_settings
+    assert 523 not in shared_settings
+
+
+def test_settings_concurrent_writers_do_not_lose_updates(settings_filepath):
+    Settings(filepath=settings_filepath)
+
+    def write_keys(thread_index):
+        settings = Settings(filepath=settings_filepath)
+        for i in range(10):
+            settings.set(f"thread{thread_index}.key{i}", i)
+
+    threads = [threading.Thread(target=write_keys, args=(n,)) for n in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    settings = Settings(filepath=settings_filepath)
+    for n in range(8):
+        assert settings.get(f"thread{n}") == {f"key{i}": i for i in range(10)}
+
+
+def test_settings_set_same_value_does_not_write(settings_filepath):
+    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    settings.set("number", 1)
+    # Every save replaces the file, so an unchanged inode means nothing was written
+    inode = settings_filepath.stat().st_ino
+
+    settings.set("settings.name", "MyName")
+    settings.set("number", 1)
+    assert settings_filepath.stat().st_ino == inode
+
+    settings.set("number", True)  # noqa: FBT003
+    assert settings.get("number") is True
+    assert settings_filepath.stat().st_ino != inode
+
+
+def test_settings_reloads_same_size_change_with_unchanged_mtime(settings_filepath):
+    settings = Settings(filepath=settings_filepath, defaults={"name": "aaaa"})
+    assert settings.get("name") == "aaaa"
+
+    # Rewrite the file in place with the same size and mtime, as on a filesystem with coarse timestamps
+    stat = settings_filepath.stat()
+    settings_filepath.write_bytes(settings_filepath.read_bytes().replace(b"aaaa", b"bbbb"))
+    os.utime(settings_filepath, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert settings.get("name") == "bbbb"
+
+
+def test_settings_keys_items_and_values(seeded_settings_filepath):
+    settings = Settings(filepath=seeded_settings_filepath, defaults=default_settings_normal_format)
+
+    assert set(settings.keys()) == {"metadata", "settings", "dictionary"}
+    assert dict(settings.items())["settings"] == {"name": "MyName", "mood": "MyMood"}
+    assert default_settings_normal_format["dictionary"] in list(settings.values())
+
+    keys = settings.keys()
+    Settings(filepath=seeded_settings_filepath).set("newkey", "newkeyvalue")
+    assert "newkey" in settings.keys()  # noqa: SIM118
+    # Earlier results are snapshots
+    assert "newkey" not in keys
+
+
+def test_settings_len_follows_changes(settings_filepath):
+    settings = Settings(filepath=settings_filepath, defaults=default_settings_normal_format)
+    assert len(settings) == 13
+
+    settings.set("newkey", "newkeyvalue")
+    assert len(settings) == 14
+
+    del settings["newkey"]
+    assert len(settings) == 13
+
+    Settings(filepath=settings_filepath).set("other.newkey", "newkeyvalue")
+    assert len(settings) == 15
+
+
+def test_settings_handles_inline_tables_and_dict_subclasses(settings_filepath):
+    settings_filepath.parent.mkdir(parents=True)
+    settings_filepath.write_bytes(b'metadata = {notice = "x"}\n\n[ui]\ntheme = {color = "red"}\n')
+    settings = Settings(filepath=settings_filepath, defaults={"ui": {"theme": {"size": 1}}})
+
+    assert settings.get("ui.theme") == {"color": "red", "size": 1}
+    settings.set("ui.theme.color", "blue")
+    assert settings.get("ui.theme.color") == "blue"
+
+    settings.set("ordered", OrderedDict(b=1))
+    assert settings.get("ordered.b") == 1
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX file modes")
+def test_settings_save_keeps_file_permissions(settings_filepath):
+    settings = Settings(filepath=settings_filepath)
+    settings_filepath.chmod(0o600)
+
+    settings.set("secret", "value")
+    assert settings_filepath.stat().st_mode & 0o777 == 0o600
+
+
+@pytest.mark.skipif(os.name == "nt", reason="creating symlinks needs extra privileges on Windows")
+def test_settings_save_updates_symlink_target(settings_filepath):
+    target = settings_filepath.with_name("target.toml")
+    Settings(filepath=target)
+    settings_filepath.symlink_to(target)
+
+    Settings(filepath=settings_filepath).set("name", "value")
+    assert settings_filepath.is_symlink()
+    assert Settings(filepath=target).get("name") == "value"
+
+
+def test_settings_save_removes_temp_file_on_failure(settings_filepath, monkeypatch):
+    settings = Settings(filepath=settings_filepath)
+
+    def fail_replace(*_args: object):
+        raise OSError
+
+    monkeypatch.setattr(Path, "replace", fail_replace)
+    with pytest.raises(OSError):  # noqa: PT011
+        settings.set("name", "value")
+    assert [p.name for p in settings_filepath.parent.iterdir()] == [settings_filepath.name]
+
+
+@pytest.mark.skipif(os.name == "nt", reason="Windows can't replace a file that another process has open")
+def test_settings_concurrent_processes_can_save(settings_filepath):
+    Settings(filepath=settings_filepath)
+    script = (
+        "import sys\n"
+        "from pathlib import Path\n"
+        "from zettings import Settings\n"
+        "settings = Settings(filepath=Path(sys.argv[1]))\n"
+        "for i in range(100):\n"
+        "    settings.set(f'process{sys.argv[2]}.key', i)\n"
+    )
+    env = {**os.environ, "PYTHONPATH": str(Path(zettings.__file__).parents[1])}
+    processes = [
+        subprocess.Popen([sys.executable, "-c", script, str(settings_filepath), str(n)], env=env)  # noqa: S603
+        for n in range(2)
+    ]
+    assert [process.wait() for process in processes] == [0, 0]
+    assert [p.name for p in settings_filepath.parent.iterdir()] == [settings_filepath.name]
+
+
+def test_settings_get_reflects_changes_to_returned_tables(settings_filepath):
+    settings = Settings(filepath=settings_filepath, always_reload=False)
+    settings.set("a", {"b": 1})
+
+    assert settings.get("a.b") == 1
+    settings.get("a")["b"] = 2
+    assert settings.get("a.b") == 2
+
+
+def test_settings_get_after_set_matches_file(settings_filepath):
+    settings = Settings(filepath=settings_filepath)
+
+    settings.set("tuple", (1, 2))
+    settings.set("nested", [[{"b": 1}]])
+
+    reloaded = Settings(filepath=settings_filepath)
+    assert settings.get("tuple") == reloaded.get("tuple") == [1, 2]
+    assert settings.get("nested") == reloaded.get("nested")
+
+
+def test_settings_len_reflects_changes_to_returned_tables(settings_filepath):
+    settings = Settings(filepath=settings_filepath, always_reload=False)
+    settings.set("a", {"b": 1})
+    size = len(settings)
+
+    settings.get("a")["c"] = 2
+    assert len(settings) == size + 1
+
+
+def test_settings_changes_to_returned_tables_are_not_saved(settings_filepath):
+    settings = Settings(filepath=settings_filepath, defaults={"ui": {"theme": "dark"}})
+
+    settings.get("ui")["scratch"] = "leaked"
+    dict(settings.items())["ui"]["scratch"] = "leaked"
+    settings.set("other", 1)
+
+    assert settings.get("ui") == {"theme": "dark"}
+    assert Settings(filepath=settings_filepath).get("ui") == {"theme": "dark"}
+
+
+def test_settings_failed_first_save_leaves_no_file(settings_filepath, monkeypatch):
+    def fail_replace(*_args: object):
+        raise OSError
+
+    with monkeypatch.context() as m:
+        m.setattr(Path, "replace", fail_replace)
+        with pytest.raises(OSError):  # noqa: PT011
+            Settings(filepath=settings_filepath)
+    assert list(settings_filepath.parent.iterdir()) == []
+
+    settings = Settings(filepath=settings_filepath)
+    assert settings.get("metadata.notice") is not None
+    assert settings.get("metadata.created") is not None
+
+
+@pytest.mark.skipif(os.name == "nt", reason="POSIX file modes")
+def test_settings_new_file_gets_default_permissions(settings_filepath):
+    umask = os.umask(0)
+    os.umask(umask)
 
-    with pytest.raises(KeyError):
-        _ = Settings(filepath=settings_filepath, defaults=defaults)
+    Settings(filepath=settings_filepath)
+    assert settings_filepath.stat().st_mode & 0o777 == 0o666 & ~umask
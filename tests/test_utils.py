@@ -1,9 +1,20 @@
 import shutil
+from collections import OrderedDict
 from pathlib import Path
 
 import pytest
-
-from zettings.utils import delete_nested_key, get_nested_value, is_valid_key, set_nested_value, validate_dictionary
+import toml
+
+from zettings.utils import (
+    delete_nested_key,
+    flatten_dictionary,
+    get_nested_value,
+    is_valid_key,
+    set_nested_path,
+    set_nested_value,
+    split_key,
+    validate_dictionary,
+)
 
 
 @pytest.fixture
@@ -37,12 +48,25 @@ def temp_filepath(tmpdir_factory: pytest.TempdirFactory):
         ('"valid key"', False),
         ('""', False),
         ("", False),
+        ("naïve", False),
+        ("キー", False),
+        ("key²", False),
     ],
 )
 def test_is_valid_key(key, expected):
     assert is_valid_key(key) == expected
 
 
+def test_split_key():
+    assert split_key("a.b.c") == ("a", "b", "c")
+    assert split_key("a|b", sep="|") == ("a", "b")
+    assert split_key("a") == ("a",)
+    with pytest.raises(ValueError, match="Invalid key"):
+        split_key("a.b c")
+    with pytest.raises(ValueError, match="Invalid key"):
+        split_key("a..b")
+
+
 def test_get_nested_invalid_key():
     d = {"a": {"b": {"c": 1}}}
     with pytest.raises(ValueError):  # noqa: PT011
@@ -97,6 +121,15 @@ def test_get_nested(d, key, expected):
     assert get_nested_value(d, key) == expected
 
 
+def test_set_nested_path():
+    d = {"a": {"b": 1}}
+    set_nested_path(d, ("a", "c", "d"), 2)
+    assert d == {"a": {"b": 1, "c": {"d": 2}}}
+
+    with pytest.raises(KeyError):
+        set_nested_path(d, ("a", "b", "c"), 3)
+
+
 def test_set_nested_with_custom_separator():
     d = {}
     set_nested_value(d, "a|b|c", 10, sep="|")
@@ -124,6 +157,16 @@ def test_get_nested_returns_none_for_non_dict():
     assert get_nested_value(d, "a.b") is None
 
 
+def test_nested_helpers_walk_dict_subclasses():
+    # The toml package parses inline tables into a dict subclass
+    for d in (toml.loads("a = {b = 1}"), {"a": OrderedDict(b=1)}):
+        assert get_nested_value(d, "a.b") == 1
+        set_nested_value(d, "a.c", 2)
+        assert get_nested_value(d, "a.c") == 2
+        delete_nested_key(d, "a.b")
+        assert get_nested_value(d, "a") == {"c": 2}
+
+
 def test_delete_nested_key():
     d = {"a": {"b": {"c": 1}}}
     delete_nested_key(d, "a.b.c")
@@ -137,6 +180,10 @@ def test_delete_nested_key():
     delete_nested_key(d, "x")
     assert d == {}
 
+    d = {"b": 1, "a": {"b": 2}}
+    delete_nested_key(d, "a.b")
+    assert d == {"b": 1, "a": {}}
+
 
 def test_delete_nested_key_invalid():
     d = {"a": {"b": {"c": 1}}}
@@ -163,3 +210,8 @@ def test_validate_dictionary():
         validate_dictionary(invalid_dict)
     with pytest.raises(ValueError):
         validate_dictionary(invalid_dict2)
+
+
+def test_flatten_dictionary():
+    d = {"a": {"b": {"c": 1}, "d": []}, "e.f": True, "g": {}}
+    assert list(flatten_dictionary(d)) == [("a.b.c", 1), ("a.d", []), ("e.f", True), ("g", {})]